@@ -144,7 +144,7 @@ def writeReflectance(fileName,v1,v2,dv,reflCoeff):
     maxWNs=2400
     nFillHeader=264
 
-    fillHeader=map(lambda x:0.,range(nFillHeader))
+    fillHeader=[0.]*nFillHeader
 
     fortranFile=FortranFile(fileName,write=True)
     fortranFile.writeFloatVector(fillHeader)
@@ -155,7 +155,7 @@ def writeReflectance(fileName,v1,v2,dv,reflCoeff):
         nWNs=int(round((v2-v1)/dv)+1)
     
     fortranFile.writeFormatVector((v1,v2,dv,nWNs),'ddfi')
-    refl=map(lambda x:refl(v1+x*dv,reflCoeff),range(nWNs))
+    refl=[refl(v1+x*dv,reflCoeff) for x in range(nWNs)]
     fortranFile.writeFloatVector(refl)
     fortranFile.writeFormatVector((v2,v2,dv,-99),'ddfi')
     fortranFile.close()
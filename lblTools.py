@@ -7,12 +7,13 @@
 import os
 import sys
 import shutil
-import re
 import time
 import math
 import types
 import glob
 import struct
+import mmap
+from collections import ChainMap
 from typing import List
 import numpy as np
 import stat
@@ -21,6 +22,12 @@ import traceback
 import logging
 from subprocess import run
 
+# numba is optional; without it the kernels below fall back to NumPy
+try:
+  from numba import njit, prange
+except ImportError:
+  njit = None
+
 logger = logging.getLogger(__name__)
 
 #from configTools import xmlConfig
@@ -35,74 +42,177 @@ WAVE_NUMBER = 'waveNumber'
 SOLAR_OPTICAL_DEPTH = 'solarOD'
 SOLAR_RADIANCE = 'solarRadiance'
 
+# panel header formats, compiled once: readTape12 expects a double dv
+# and an 8-byte point count, rpReadTape12 a float dv and a 4-byte count
+_IFMT = 'q' if struct.calcsize('l') == 8 else 'l'
+_HDR_SINGLE = struct.Struct('ddd%s' % _IFMT)
+_HDR_DOUBLE = struct.Struct('dddq')
+_RP_HDR_SINGLE = struct.Struct('ddfi')
+_RP_HDR_DOUBLE = struct.Struct('dddl')
+
+if njit is not None:
+  @njit(parallel=True, fastmath=True, cache=True)
+  def _interp_log(lp, lpin, vin, rh_flag):
+    """
+    Numba kernel for interP(); takes log pressures, lpin must be 
+    ascending
+    """
+
+    n = lpin.size
+    lp100 = np.log(100.)
+    out = np.empty_like(lp)
+    for i in prange(lp.size):
+      k = min(max(np.searchsorted(lpin, lp[i]), 1), n - 1)
+
+      # levels on the input grid are returned as is, without the rh clamp
+      if lp[i] == lpin[k]:
+        out[i] = vin[k]
+      elif lp[i] == lpin[k - 1]:
+        out[i] = vin[k - 1]
+      else:
+        out[i] = vin[k - 1] + (lp[i] - lpin[k - 1]) / \
+          (lpin[k] - lpin[k - 1]) * (vin[k] - vin[k - 1])
+        if rh_flag and lp[i] < lp100 and out[i] > 0.003: out[i] = 0.001
+      # endif exact match
+    # end p loop
+
+    return out
+  # end _interp_log()
+
+  @njit(cache=True)
+  def _fill_wn(v1, dv, n, out, offset):
+    """
+    Fill out[offset:offset+n] with the wavenumbers of a panel
+    """
+
+    for i in range(n): out[offset + i] = v1 + i * dv
+  # end _fill_wn()
+
+  @njit(cache=True, fastmath=True)
+  def _refl_kernel(wn, c0, c1, c2):
+    """
+    Evaluate the quadratic surface reflectance at each wavenumber
+    """
+
+    out = np.empty_like(wn)
+    for i in range(wn.size): out[i] = c0 + wn[i] * (c1 + wn[i] * c2)
+
+    return out
+  # end _refl_kernel()
+else:
+  _interp_log = None
+  _refl_kernel = None
+
+  def _fill_wn(v1, dv, n, out, offset):
+    out[offset:offset + n] = v1 + dv * np.arange(n, dtype=np.float64)
+  # end _fill_wn()
+# endif njit
+
+def _panelWaveNumbers(chunks):
+  """
+  Build the wavenumber array of a TAPE12 from its panels
+
+  Input
+    chunks -- list of (v1, dv, n) tuples, one per panel, in file order
+
+  Output
+    waveNumbers -- float64 array of the concatenated panel wavenumbers
+  """
+
+  waveNumbers = np.empty(sum(n for _, _, n in chunks), dtype=np.float64)
+  offset = 0
+  for v1, dv, n in chunks:
+    _fill_wn(v1, dv, n, waveNumbers, offset)
+    offset += n
+  # end loop over panels
+
+  return waveNumbers
+# end _panelWaveNumbers()
+
+def _iter_records(buff):
+  """
+  Iterate over the records of a Fortran unformatted sequential file
+
+  Input
+    buff -- bytes-like object (e.g., mmap) holding the file
+
+  Output
+    (offset, length) of each record's data in buff; iteration stops
+    at the end of buff or at the first truncated or inconsistent 
+    record
+  """
+
+  marker = struct.Struct(FortranFile.FortranFile.sizeFormat)
+  offset = 0
+  while offset + marker.size <= len(buff):
+    (length,) = marker.unpack_from(buff, offset)
+    end = offset + marker.size + length
+    if end + marker.size > len(buff): return
+    if marker.unpack_from(buff, end)[0] != length: return
+
+    yield offset + marker.size, length
+    offset = end + marker.size
+  # end while offset
+# end _iter_records()
+
 def interP(p, pin, vin, debug=False, rh=None):
   """
-  Interpolate pressure grid
+  Interpolate pressure grid (linear in log-pressure)
 
   Input
     p -- float array
-    pin -- float array
+    pin -- float array, monotonic
     vin -- float arr
 
   Output
     z -- float array
+
+  Keywords
+    rh -- if not None, clamp values above 0.003 to 0.001 for
+      pressures below 100
   """
 
-  z = []
-  for p1 in p:
-    mmin = [-999999, p1]
-    mmax = [999999, p1]
-    cont = 0
-    for k in range(len(pin)):
-        if p1 != pin[k]:
-            gg = pin[k] - p1
-            if gg > 0 and gg < mmax[0]:
-                mmax = [gg, pin[k], k]
-            elif gg < 0 and gg > mmin[0]:
-                mmin = [gg, pin[k], k]
-        # endif p1 !=
-
-        if p1 == pin[k]:
-            z.append(vin[k])
-            cont = 1
-            break
-        # endif p1 ==
-
-    if cont: continue
-
-    if mmax[1] == p1:
-      mmax = [-999999, p1]
-      for k in range(len(pin)):
-        if p1 != pin[k] and k != mmin[2]:
-          gg = pin[k] - p1
-          if gg < 0 and gg > mmax[0]: mmax = [gg, pin[k], k]
-        # endif p1 and k
-    # endif mmax[1]
-
-    if mmin[1] == p1: mmin = [999999, p1]
-
-    for k in range(len(pin)):
-      if p1 != pin[k] and k != mmax[2]:
-        gg = pin[k] - p1
-        if gg > 0 and gg < mmin[0]: mmin = [gg, pin[k], k]
-      # end if p1 and k
-    # endif mmin[1]
-
-    z1 = math.log(p1) - math.log(mmin[1])
-    z2 = math.log(mmax[1]) - math.log(mmin[1])
-    z3 = vin[mmax[2]] - vin[mmin[2]]
-    z4 = vin[mmin[2]]
-    hh = z4 + z1 / z2 * z3
-
-    if (rh is not None) and (p1 < 100) and (hh > 0.003): hh = 0.001
-
-    z.append(hh)
-  # end p loop
+  p = np.atleast_1d(np.asarray(p, dtype=float))
+  pin = np.asarray(pin, dtype=float)
+  vin = np.asarray(vin, dtype=float)
+
+  # the interpolation needs an ascending grid, and profiles are usually
+  # given surface to TOA (descending pressure)
+  if pin[0] > pin[-1]:
+    pin = pin[::-1]
+    vin = vin[::-1]
+  # endif pin
+
+  # logs are taken once here rather than per bracket lookup
+  lp = np.log(p)
+  lpin = np.log(pin)
+
+  if _interp_log is not None:
+    return _interp_log(lp, np.ascontiguousarray(lpin),
+                       np.ascontiguousarray(vin), rh is not None)
+  # endif _interp_log
+
+  z = np.interp(lp, lpin, vin)
+
+  # np.interp holds the end values outside of pin; those points are
+  # extrapolated from the two nearest levels instead
+  lo = lp < lpin[0]
+  hi = lp > lpin[-1]
+  z[lo] = vin[0] + (lp[lo] - lpin[0]) / (lpin[1] - lpin[0]) * \
+    (vin[1] - vin[0])
+  z[hi] = vin[-2] + (lp[hi] - lpin[-2]) / (lpin[-1] - lpin[-2]) * \
+    (vin[-1] - vin[-2])
+
+  # levels on the input grid keep their input value (np.interp returns 
+  # vin exactly there) and are not clamped
+  if rh is not None:
+    z = np.where((p < 100) & (z > 0.003) & ~np.isin(lp, lpin), 0.001, z)
+  # endif rh
 
   return z
 # end interP()
 
-def readOD(path, double=False):
+def readOD(path, double=False, layout=None):
   """
   Read in binary LBLRTM ODint files (IMRG=1 and IOD=1, 3, or 4 in
   LBLRTM specifications (Record 1.2 in lblrtm_instructions.html)
@@ -121,6 +231,9 @@ def readOD(path, double=False):
 
   Keywords
     double -- boolean, read in double precision OD values
+    layout -- string, if 'soa', return a single C-contiguous 
+      (nWN x 2) float array of wavenumbers and optical depths 
+      instead of the (ff, od) tuple
   """
   ff, od = readTape12(path, double=double)
 
@@ -149,64 +262,53 @@ def readOD(path, double=False):
   f = open(os.path.join(path, 'TAPE7'))
   lines = f.readlines()
   f.close()
-  z = re.split('\s+', lines[1].strip())
+  z = lines[1].split()
   n = int(z[1])
 
-  # initialize list that will eventually be nMol x nLayers
-  # (molecules per cm-2)
-  # list of lists, where each sublist contains nMol elements
-  parms = []
-
   # read in ASCII TAPE7 parameters (calculations of molecular amounts)
-  # loop over layers (this may be assuming a certain number of 
-  # molecules, or at least the number should not exceed a threshold 
-  # of 7)
-  for i in range(2,len(lines),2):
-    p = []
-    z = re.split('\s+', lines[i].strip())
-    p.append(float(z[0]))
-
+  # (this may be assuming a certain number of molecules, or at least 
+  # the number should not exceed a threshold of 7)
+  layers = [lines[i].split() for i in range(2, len(lines), 2)]
+  amounts = np.array([lines[i].split() for i in range(3, len(lines), 2)],
+                     dtype=np.float64)
+
+  # altitude and pressure levels: bottom and top of the first layer, 
+  # then the top of each following layer (altitude and pressure can 
+  # run together in one field)
+  aLev = [float(layers[0][3]), float(layers[0][6])]
+  pLev = [float(layers[0][4]), float(layers[0][7])]
+  for z in layers[1:]:
     if len(z)>5:
-      a0 = float(z[3])
-      p0 = float(z[4])
-    else:
-      zz = re.split('\.', z[3])
-      a0 = float(zz[0] + '.' + zz[1])
-      p0 = float('.' + zz[2])
-    # endif len z
-
-    if len(z)>7:
-      a1 = float(z[6])
-      dz = a1 - a0
-      a2 = a1
-      p1 = float(z[7])
-      dp = p0 - p1
-      p2 = p1
-    elif len(z)>3:
-      dz = a0 - a2
-      a2 = a0
-      dp = p2 - p0
-      p2 = p0
+      aLev.append(float(z[3]))
+      pLev.append(float(z[4]))
     else:
-      dz = 0
-      dp = 0
+      zz = z[3].split('.')
+      aLev.append(float(zz[0] + '.' + zz[1]))
+      pLev.append(float('.' + zz[2]))
     # endif len z
-
-    p.append(dz)
-    p.append(dp)
-
-    z = re.split('\s+', lines[i + 1].strip())
-
-    # for i in z:p.append(float(i))
-    # concatenatate (NOT append) floating point list of z onto 
-    # existing p (mol amounts for all all molecules in a given layer)
-    p += map(float, z)
-    parms.append(p)
-  # end loop over TAPE7
+  # end loop over layers
+
+  # nLayers x (pressure, dz, dp, molecular amounts (cm-2)), filled by 
+  # column
+  parms = np.empty((len(layers), 3 + amounts.shape[1]), dtype=np.float64)
+  parms[:, 0] = [float(z[0]) for z in layers]
+  parms[:, 1] = np.diff(aLev)
+  parms[:, 2] = -np.diff(pLev)
+  parms[:, 3:] = amounts
   """
 
+  # pack wavenumber and optical depth into one (N, 2) array
+  if layout == 'soa':
+    ffOD = np.empty((ff.size, 2), dtype=np.float64)
+    ffOD[:, 0] = ff
+    ffOD[:, 1] = od[0]
+    return ffOD
+  # endif layout
+
   #return (np.array(ff), np.array(od), np.array(parms))
-  return (np.array(ff), np.array(od))
+  # readTape12 already returns contiguous float64 arrays, so no copy
+  # is made here
+  return (ff, od)
 # end readOD()
 
 def readTape7(fName, sList=False):
@@ -226,23 +328,22 @@ def readTape7(fName, sList=False):
     sList -- 
   """
 
-  def cnvline(l, fmt=','):
-    ll = re.split(fmt, l.strip())
-    ll = map(float, ll)
-    return ll
-  # end cnvline()
-
   f = open(fName)
   l = f.readlines()
   f.close()
   ll = []
   l = l[2:]
 
+  # molecular amounts (every other line) are parsed by NumPy in a
+  # single pass, one row per layer
+  amounts = np.array([line.split() for line in l[1::2]],
+                     dtype=np.float64).tolist()
+
   # loop over layers (this may be assuming a certain number of 
   # molecules, or at least the number should not exceed a threshold 
   # of 7)
   for i in range(0, len(l), 2):
-    q = re.split('\s+', l[i].strip())
+    q = l[i].split()
     if not i:
       try:
         if sList:
@@ -265,7 +366,7 @@ def readTape7(fName, sList=False):
           q = [float(q[0]), float(q[1]), float(q[3]),
                float(q[3]) - q2]
         except (IndexError,ValueError):
-          zz = re.split('\.', q[3])
+          zz = q[3].split('.')
           q3 = float(zz[0] + zz[1])
           q = [float(q[0]), float(q[1]), q3, q3 - q2]
       else:
@@ -276,7 +377,7 @@ def readTape7(fName, sList=False):
              float(q[5])], float(q[3]), float(q[3]) - q2]
       # endif sList
 
-    q += cnvline(l[i + 1].strip(), fmt='\s+')
+    q += amounts[i // 2]
     ll.append(q)
   # end loop over lines
 
@@ -319,17 +420,19 @@ def readTape12(fileName, double=False, fType=0, output_variables_per_panel=1):
       tested with this function
   """
 
-  def readLBLPanel(ffObj, pHeaderForm, output_variables_per_panel = 1):
+  def readLBLPanel(buff, records, pHeader, output_variables_per_panel = 1):
     """
     Read in a single panel
 
     Input
-      ffObj -- FortranFile object
-      pHeaderForm -- string, format of panel header (e.g., 'dddl' for
-        3 doubles and a long integer, which would mean wn_start and 
-        wn_end are doubles, the spectral resolution is double 
-        precision, and the number of points in the panel is a long 
-        integer; wn_start and wn_end are always doubles)
+      buff -- mmap (or bytes) of the whole file
+      records -- iterator over (offset, length) of the remaining 
+        records in buff (see _iter_records())
+      pHeader -- struct.Struct, compiled format of panel header (e.g.,
+        'dddl' for 3 doubles and a long integer, which would mean 
+        wn_start and wn_end are doubles, the spectral resolution is 
+        double precision, and the number of points in the panel is a 
+        long integer; wn_start and wn_end are always doubles)
 
     Output
       outWN -- float array, wavenumbers of spectrum for a given panel
@@ -341,62 +444,67 @@ def readTape12(fileName, double=False, fType=0, output_variables_per_panel=1):
     """
 
     # initialization of variables that change with panel
-    OK = True;
-    outWN = []; outParam = []
+    # (each panel is a view into buff until the final concatenate)
+    dtype = np.dtype(np.float64 if double else np.float32)
+    outWN = []
     outParam = [[] for _ in range(output_variables_per_panel)]
-    while OK:
-      buff = fortranFile.getRecord()
+    for offset, length in records:
+      # skip to next panel header
+      if length != pHeader.size: continue
 
-      while buff is not None and len(buff) != struct.calcsize(lfmt):
-        buff = fortranFile.getRecord()
-      # end while buff
-      if buff:
-        try:
-          # read panel header and underlying data
-          (v1, v2, dv, nPanel) = struct.unpack(lfmt, buff)
-          logger.info('v1: %f v2: %f, dv: %f num: %d', v1, v2, dv, nPanel)
-          for i in range(output_variables_per_panel):
-            data = fortranFile.readDoubleVector() if double else \
-                fortranFile.readFloatVector()
-            # concatenate (NOT append) onto output
-            outParam[i] += data
-          # concatenate wavenumber array (without numpy) based 
-          # on spectral resolution and starting wavenumber
-          outWN += \
-            map(lambda x:v1 + x * dv, range(len(data)))
-        except (KeyboardInterrupt, SystemExit):
-          raise
-        except Exception as e:
-          logger.error('Data could not be read, file may be corrupted')
-          OK = False
-      else:
-        # end of panel
-        #continue
-        OK = False
-      # endif buff
-    # end while OK
-    return outWN, outParam
+      try:
+        # read panel header and underlying data
+        (v1, v2, dv, nPanel) = pHeader.unpack_from(buff, offset)
+        logger.info('v1: %f v2: %f, dv: %f num: %d', v1, v2, dv, nPanel)
+        panel = []
+        for _ in range(output_variables_per_panel):
+          offset, length = next(records)
+          panel.append(np.frombuffer(buff, dtype=dtype,
+            count=length // dtype.itemsize, offset=offset))
+        # end loop over variables
+        for i, data in enumerate(panel): outParam[i].append(data)
+
+        # wavenumber array is filled in once all panels are read,
+        # based on spectral resolution and starting wavenumber
+        outWN.append((v1, dv, data.size))
+      except (KeyboardInterrupt, SystemExit):
+        raise
+      except Exception:
+        logger.error('Data could not be read, file may be corrupted')
+        break
+    # end loop over records
+
+    if not outWN: return np.array([]), np.empty((output_variables_per_panel, 0))
+
+    return _panelWaveNumbers(outWN), \
+      np.array([np.concatenate(param) for param in outParam], dtype=np.float64)
   # end readLBLPanel()
 
   # main readTape12()
-  iFormat = 'l'
-  if struct.calcsize('l') == 8:iFormat = 'q'
+  # format for each panel header
+  pHeader = _HDR_DOUBLE if double else _HDR_SINGLE
+  logger.info('header struct format %s', pHeader.format)
 
-  # instantiate FortranFile object
-  fortranFile = FortranFile.FortranFile(fileName)
+  # the file is memory-mapped and records are sliced out of it
+  # directly rather than read one at a time
+  with open(fileName, 'rb') as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return np.array([]), np.empty((output_variables_per_panel, 0))
 
-  # read file header
-  data = fortranFile.getRecord()
-  logger.info("TOP HEADER %s", str(data))
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buff:
+      records = _iter_records(buff)
 
-  # format for each panel header
-  if double: lfmt = 'dddq'
-  else: lfmt = 'ddd%s' % iFormat
-  logger.info('header struct format %s', lfmt)
+      # read file header
+      for offset, length in records:
+        logger.info("TOP HEADER %s", str(buff[offset:offset + length]))
+        break
+      # end file header
 
-  waveNumbers, output = readLBLPanel(fortranFile, lfmt, output_variables_per_panel=output_variables_per_panel)
+      waveNumbers, output = readLBLPanel(buff, records, pHeader, output_variables_per_panel=output_variables_per_panel)
+    # end with mmap
+  # end with open
 
-  return np.array(waveNumbers), np.array(output)
+  return waveNumbers, output
 # end readTape12()
 
 def rpReadTape12(fileName, double=False, fType=0):
@@ -438,9 +546,6 @@ def rpReadTape12(fileName, double=False, fType=0):
   import utils
 
   # main readTape12()
-  iFormat = 'l'
-  if struct.calcsize('l') == 8:iFormat = 'i'
-
   # instantiate FortranFile object
   fortranFile = FortranFile.FortranFile(fileName)
 
@@ -448,8 +553,8 @@ def rpReadTape12(fileName, double=False, fType=0):
   data = fortranFile.getRecord()
 
   # format for each panel header
-  lfmt = 'dddl' if double else 'ddf%s' % iFormat
-  headLen = struct.calcsize(lfmt)
+  pHeader = _RP_HDR_DOUBLE if double else _RP_HDR_SINGLE
+  headLen = pHeader.size
 
   # the number of output parameters differs by file type,
   # how many are expected?
@@ -463,73 +568,38 @@ def rpReadTape12(fileName, double=False, fType=0):
 
   paramStr = ['Scanned', 'Radiance', 'Transmittance']
 
+  # panels are collected as arrays and concatenated once at the end
+  dtype = np.float64 if double else np.float32
+  wnChunks = []
+  paramChunks = []
+
   while True:
-    # skip to first panel header
+    # skip to next panel header
     buff = fortranFile.getRecord()
-    #while buff is None: buff = fortranFile.getRecord()
-    #while buff is not None and len(buff) != headLen:
-    #  buff = fortranFile.getRecord()
-
-    if buff:
-      if buff and len(buff) == headLen:
-        (v1, v2, dv, nPtPanel) = struct.unpack(lfmt, buff)
-        print(v1, v2, dv)
-      else:
-        data = fortranFile.readDoubleVector() if double else \
-          fortranFile.readFloatVector()
-      # endif buf and len
-    else:
-      data = fortranFile.readDoubleVector() if double else \
-        fortranFile.readFloatVector()
-      print(len(data))
-    # endif buff len
+    if buff is None: break
+    if len(buff) != headLen: continue
+
+    (v1, v2, dv, nPtPanel) = pHeader.unpack(buff)
+    logger.info('v1: %f v2: %f, dv: %f num: %d', v1, v2, dv, nPtPanel)
+    if nPtPanel <= 0: break
 
-    # break
+    data = fortranFile.getRecord()
     if data is None: break
 
-    # concatenate (NOT append) onto output
     # for now, this is just radiance -- looks like other
     # parameters like transmittances are in other panels
-    outParam += data
+    data = np.frombuffer(data, dtype=dtype)
+    paramChunks.append(data)
 
-    # concatenate wavenumber array (without numpy) based 
+    # wavenumber array is filled in once all panels are read, based 
     # on spectral resolution and starting wavenumber
-    outWN += \
-      map(lambda x:v1 + x * dv, range(len(data)))
-
-    #print ctr, v1, v2, len(outParam)
+    wnChunks.append((v1, dv, data.size))
   # endwhile
 
-  # sys.exit('GOT HERE')
-  if buff:
-    try:
-      # read panel header and underlying data
-      
-      data = fortranFile.readDoubleVector() if double else \
-        fortranFile.readFloatVector()
-
-      # concatenate (NOT append) onto output
-      # for now, this is just radiance -- looks like other
-      # parameters like transmittances are in other panels
-      outParam += data
-
-      # concatenate wavenumber array (without numpy) based 
-      # on spectral resolution and starting wavenumber
-      outWN += \
-        map(lambda x:v1 + x * dv, range(len(data)))
-    except (KeyboardInterrupt, SystemExit):
-      raise
-    except:
-      #print 'Data could not be read, file may be corrupted'
-      OK = False
-  else:
-    # end of panel
-    #continue
-    OK = False
-  # endif buff
-# end while OK
+  if not wnChunks: return np.array([]), np.array([])
 
-  waveNumbers, output = np.array(outWN), np.array(outParam)
+  waveNumbers = _panelWaveNumbers(wnChunks)
+  output = np.concatenate(paramChunks).astype(np.float64, copy=False)
 
   return waveNumbers, output
 # end rpReadTape12()
@@ -565,18 +635,18 @@ def removeFileName(fileName):
 
 def generatePressureGrid(pressure, observer, target, nLayers):
   try:
-    try:
-      mn = int(min(pressure))
-      mx = int(max(pressure))
-    except (ValueError,IndexError,TypeError):
+    # anything that is not a non-empty profile uses the observer/target range
+    if np.ndim(pressure) > 0 and np.size(pressure) > 0:
+      pressure = np.asarray(pressure, dtype=float)
+      mn = int(pressure.min())
+      mx = int(pressure.max())
+    else:
       mn = int(min([observer, target]))
       mx = int(max([observer, target]))
-    # end try
-
-    dx = (mx - mn) / (nLayers - 1)
+    # endif pressure
 
-    layers = map(lambda x: mx - x * dx, range(nLayers))
-    return -len(layers), layers
+    layers = np.linspace(mx, mn, nLayers)
+    return -layers.size, layers
   except (KeyboardInterrupt, SystemExit):
     raise
   except:
@@ -587,23 +657,50 @@ def generatePressureGrid(pressure, observer, target, nLayers):
 def generateHeightGrid(heights, observer, target, nLayers):
     # input heights assumed to be in meters
     try:
-        dx = int(max(heights) - min(heights)) / (nLayers - 1)
-        layers = map(lambda x: x * dx / 1000. + min(heights) / 1000., range(nLayers))
-        layer_list = list(layers)
-        return len(layer_list), layer_list
+        # anything that is not a non-empty profile uses the observer/target range
+        if np.ndim(heights) > 0 and np.size(heights) > 0:
+            # LBLRTM altitudes are in km; the extent is truncated to whole meters
+            heights = np.asarray(heights, dtype=float)
+            hMin = heights.min()
+            layers = np.linspace(hMin, hMin + int(heights.max() - hMin), nLayers) / 1000.
+        else:
+            layers = np.linspace(min([observer, target]), max([observer, target]), nLayers)
+        return layers.size, layers
     except (KeyboardInterrupt, SystemExit) as e:
         raise e
     except:
-        try:
-            hRange = max([observer, target]) - min([observer, target])
-            dx = hRange / (nLayers - 1)
-            layers = map(lambda x: x * dx + min([observer, target]), range(nLayers))
-            layer_list = list(layers)
-            return len(layer_list), layer_list
-        except (KeyboardInterrupt, SystemExit) as e:
-            raise e
-        except:
-            return 0, 0
+        return 0, 0
+
+def _fmt_surface(st, refl):
+    """
+    Format TAPE5 record 1.4: the 7 surface parameters (TBOUND, 
+    SREMIS(1-3), SRREFL(1-3)) and the surface reflection type
+    """
+
+    return f'{st[0]:10.3f}{st[1]:10.3f}{st[2]:10.3f}{st[3]:10.3f}' \
+        f'{st[4]:10.3f}{st[5]:10.3f}{st[6]:10.3f}{refl:>5s}'
+
+def _fmt_grouped(values, fmt='%10.3f', perLine=8):
+    """
+    Format TAPE5 record 3.3B style level lists: perLine fields of fmt per
+    line, with a shorter final line if the levels do not fill it
+    """
+
+    x = np.asarray(values, dtype=np.float64)
+    nFull = x.size // perLine * perLine
+    rowFmt = fmt * perLine
+    lines = [rowFmt % tuple(row)
+             for row in x[:nFull].reshape(-1, perLine).tolist()]
+    if nFull < x.size: lines.append(fmt * (x.size - nFull) % tuple(x[nFull:].tolist()))
+
+    return lines
+
+def _writeLines(fileName, lines):
+    """
+    Write the buffered TAPE5 records to fileName with a single write
+    """
+
+    with open(fileName, 'w') as f: f.write('\n'.join(lines + ['']))
 
 def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=False):    
     DEFAULT_NMOL=7
@@ -623,7 +720,8 @@ def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=
         except OSError:
             pass
 
-    tape5file = open(outputFileName, 'w')
+    # records are collected and written with a single call at the end
+    tape5Lines = []
 
     waveNumber1 = parameterDictionary['v1']
     waveNumber2 = parameterDictionary['v2']
@@ -631,37 +729,23 @@ def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=
 
     # Define Tangent
 
-    if parameterDictionary.__contains__('tangentFlag') and parameterDictionary['tangentFlag']:
-        tangent=1
-    else:
-        tangent=0
+    tangent = 1 if parameterDictionary.get('tangentFlag') else 0
 
     # Define IAERSL
 
-    if parameterDictionary.__contains__('aerosols'):
-        aerosols = parameterDictionary['aerosols']
-    else: 
-        aerosols = 0
+    aerosols = parameterDictionary.get('aerosols', 0)
 
     # Define IEMIT
 
-    if parameterDictionary.__contains__('output'):
-        outputType = int(parameterDictionary['output'])
-    else: outputType = 0
+    outputType = int(parameterDictionary.get('output', 0))
 
-    if parameterDictionary.__contains__('model'):
-        model = int(parameterDictionary['model'])
-    else: model = None
+    model = parameterDictionary.get('model')
+    if model is not None: model = int(model)
 
-    if parameterDictionary.__contains__('units'):
-        units = int(parameterDictionary['units'])
-    else: units = None
+    units = parameterDictionary.get('units')
+    if units is not None: units = int(units)
 
-    if not parameterDictionary.__contains__('usePressure'):
-        observer = parameterDictionary['h1'] / 1000.
-        target = parameterDictionary['h2'] / 1000.
-        units = 1
-    elif not parameterDictionary['usePressure']:
+    if not parameterDictionary.get('usePressure'):
         observer = parameterDictionary['h1'] / 1000.
         target = parameterDictionary['h2'] / 1000.
         units = 1
@@ -670,16 +754,9 @@ def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=
         target = parameterDictionary['h2']
         units = -1
 
-    if parameterDictionary.__contains__('pathL'): pl = parameterDictionary['pathL'] / 1000.
-    elif parameterDictionary.__contains__('pathLength'): pl = parameterDictionary['pathLength'] / 1000.
-    else: pl = 0
+    pl = parameterDictionary.get('pathL', parameterDictionary.get('pathLength', 0)) / 1000.
 
-    if parameterDictionary.__contains__('horz'): 
-        if parameterDictionary['horz']:
-            horz=1
-        else:
-            horz=0
-    else: horz = 0
+    horz = 1 if parameterDictionary.get('horz') else 0
 
     angle = parameterDictionary['angle']
 
@@ -688,18 +765,17 @@ def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=
     userAltitudes = []
     userPressures = []
     
-    if parameterDictionary.__contains__('userDefinedLevels'):
+    if 'userDefinedLevels' in parameterDictionary:
         parameterDictionary['udl'] = parameterDictionary['userDefinedLevels']
 
-    if parameterDictionary.__contains__('udl'):
+    if 'udl' in parameterDictionary:
         if parameterDictionary['udl']:
             if isinstance(parameterDictionary['udl'], list):
-                if parameterDictionary.__contains__('usePressure') and parameterDictionary['usePressure']:
-                    userPressures = sorted(parameterDictionary['udl'],
-                            None, None, 1)
+                if parameterDictionary.get('usePressure'):
+                    userPressures = sorted(parameterDictionary['udl'], reverse=True)
                     userDefinedLayers = -len(parameterDictionary['udl'])
                 else:
-                    userAltitudes = sorted(parameterDictionary['udl'])
+                    userAltitudes = np.sort(np.asarray(parameterDictionary['udl'], dtype=float))
                     userDefinedLayers = len(parameterDictionary['udl'])
             else:
                 print(f"Setting User Defined Levels as {parameterDictionary['udl']}")
@@ -710,79 +786,61 @@ def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=
                 else: 
                   userDefinedLayers = 100
 
-                if parameterDictionary.__contains__('Height'): height = parameterDictionary['Height']
-                else: height = None
+                height = parameterDictionary.get('Height')
                     
-                if parameterDictionary.__contains__('usePressure'):
-                    if parameterDictionary['usePressure']:
-                        userDefinedLayers, userPressures = generatePressureGrid(parameterDictionary['Pres'],
-                                                                             observer, target,
-                                                                             userDefinedLayers)
-                    else:                            
-                        userDefinedLayers, userAltitudes = generateHeightGrid(height,
-                                                                           observer, target, userDefinedLayers)
+                if parameterDictionary.get('usePressure'):
+                    userDefinedLayers, userPressures = generatePressureGrid(parameterDictionary['Pres'],
+                                                                         observer, target,
+                                                                         userDefinedLayers)
                 else:
                     userDefinedLayers, userAltitudes = generateHeightGrid(height,
                                                                        observer, target, userDefinedLayers)
         else: userDefinedLayers = 0
     else: userDefinedLayers = 0
 
-    if parameterDictionary.__contains__('surfaceTerrain'):
-        surfaceTerrain = parameterDictionary['surfaceTerrain']
-    else: surfaceTerrain = [300, 0.1, 0, 0, 0.9, 0, 0]
+    surfaceTerrain = parameterDictionary.get('surfaceTerrain', [300, 0.1, 0, 0, 0.9, 0, 0])
 
     # write record 1.1
     print("Writing Record 1.1")
-    print('$ TAPE5 by Python, range %f %f %s' % (waveNumber1, waveNumber2, time.asctime()), file=tape5file)
+    tape5Lines.append('$ TAPE5 by Python, range %f %f %s' % (waveNumber1, waveNumber2, time.asctime()))
 
-    if not parameterDictionary.__contains__('inFlag'): parameterDictionary['inFlag'] = 0
-    if not parameterDictionary.__contains__('iotFlag'): parameterDictionary['iotFlag'] = 0
+    parameterDictionary.setdefault('inFlag', 0)
+    parameterDictionary.setdefault('iotFlag', 0)
 
     # solar upwelling
     if outputType == 2 and not monoRTM:
         print("Writing for solar upwelling")
         if parameterDictionary['inFlag'] == 2 and parameterDictionary['iotFlag'] == 2:
-            print(' HI=0 F4=0 CN=0 AE=0 EM=2 SC=0 FI=0 PL=0 TS=0 AM=0 MG=4 LA=0 OD=0 XS=0    0    0', file=tape5file)
-            print("%5d%5d  %3d%5d%10.5f     %10.5f" % (parameterDictionary['inFlag'], parameterDictionary['iotFlag'], parameterDictionary['solarDay'], -1,0.0,0.0), file=tape5file)
-            surfRefl = ['s']
-            print('%10.3f%10.3f%10.3f%10.3f%10.3f%10.3f%10.3f%5s' % tuple(surfaceTerrain + surfRefl), file=tape5file)
+            tape5Lines.append(' HI=0 F4=0 CN=0 AE=0 EM=2 SC=0 FI=0 PL=0 TS=0 AM=0 MG=4 LA=0 OD=0 XS=0    0    0')
+            tape5Lines.append("%5d%5d  %3d%5d%10.5f     %10.5f" % (parameterDictionary['inFlag'], parameterDictionary['iotFlag'], parameterDictionary['solarDay'], -1,0.0,0.0))
+            tape5Lines.append(_fmt_surface(surfaceTerrain, 's'))
 
             # print("0.0      0.0", file=tape5file)
             # print("-1.", file=tape5file)
-            print("%", file=tape5file)
-            tape5file.close()
+            tape5Lines.append("%")
+            _writeLines(outputFileName, tape5Lines)
             return os.path.join(path, 'TAPE5')
 
-    if parameterDictionary.__contains__('iodFlag'):
-        iodFlag = parameterDictionary['iodFlag']
-    else:
-        if outputType: iodFlag = 1
-        else: iodFlag = 1
+    iodFlag = parameterDictionary.get('iodFlag', 1)
 
-    if parameterDictionary.__contains__('noContinuum'):
-        if parameterDictionary['noContinuum']:
-            continuumFlag = 0
-        else:
-            continuumFlag = 1
-    else:
-        continuumFlag = 1
+    continuumFlag = 0 if parameterDictionary.get('noContinuum') else 1
             
     # write record 1.2
     print("Writing Record 1.2")
     if monoRTM:
         iPlot = 1
         iod = 0
-        print("%4s%1i%9s%1i%9s%1i%14s%1i%9s%1i%14s%1i%4s%1i%16s%4i" % ("", 1, "", 1, "", 1, "", iPlot, "", 1, "", iod, "", 0, "", 0) , file=tape5file)       
+        tape5Lines.append("%4s%1i%9s%1i%9s%1i%14s%1i%9s%1i%14s%1i%4s%1i%16s%4i" % ("", 1, "", 1, "", 1, "", iPlot, "", 1, "", iod, "", 0, "", 0))
     else:
         if outputType < 2:
-            print(\
+            tape5Lines.append(\
             ' HI=1 F4=1 CN=%0d AE=%0d EM=%0d SC=0 FI=0 PL=0 TS=0 AM=1 MG=3 LA=0 OD=%0d XS=0    0    0' \
-              % (continuumFlag,aerosols, outputType, iodFlag), file=tape5file)
+              % (continuumFlag,aerosols, outputType, iodFlag))
         else:
             print("Writing record 1.2 for solar")
-            print(\
+            tape5Lines.append(\
             ' HI=0 F4=0 CN=0 AE=%0d EM=%0d SC=0 FI=0 PL=0 TS=0 AM=1 MG=4 LA=0 OD=%0d XS=0    0    0' \
-              % (aerosols, outputType, iodFlag), file=tape5file)
+              % (aerosols, outputType, iodFlag))
 
         # write record 1.2a
         print("Writing Record 1.2a")
@@ -791,59 +849,50 @@ def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=
             #  1-5,    6-10,   13-15
             #   I5,      I5,  2X, I3
 
-            print("%5d%5d  %3d" % (parameterDictionary['inFlag'], parameterDictionary['iotFlag'],
-                                              parameterDictionary['solarDay']), file=tape5file)
+            tape5Lines.append("%5d%5d  %3d" % (parameterDictionary['inFlag'], parameterDictionary['iotFlag'],
+                                              parameterDictionary['solarDay']))
 
     # determine molecule scaling
         
+    co2scale = parameterDictionary.get('co2scale')
+    wvScale = parameterDictionary.get('wvScale')
+    ch4scale = parameterDictionary.get('ch4scale')
+
     nms = 0
-    if parameterDictionary.__contains__('co2scale'):
-        if parameterDictionary['co2scale']: nms = 2
-    if parameterDictionary.__contains__('wvScale'):
-        if parameterDictionary['wvScale']: nms = 6
-    if parameterDictionary.__contains__('ch4scale'):
-        if parameterDictionary['ch4scale']: nms = 6
+    if co2scale: nms = 2
+    if wvScale or ch4scale: nms = 6
             
     if nms>0:
-        co2scale = DEFAULT_CO2
-        if parameterDictionary.__contains__('co2scale'): co2scale = parameterDictionary['co2scale']
-        if not co2scale: co2scale = DEFAULT_CO2
-
-        wvScale = 1.0
-        if parameterDictionary.__contains__('wvScale'): wvScale = parameterDictionary['wvScale']
-        if not wvScale: wvScale = 1.0
-
-        ch4scale = DEFAULT_CH4
-        if parameterDictionary.__contains__('ch4scale'): ch4scale = parameterDictionary['ch4scale']
-        if not ch4scale: ch4scale = DEFAULT_CH4
+        co2scale = co2scale or DEFAULT_CO2
+        wvScale = wvScale or 1.0
+        ch4scale = ch4scale or DEFAULT_CH4
 
     co2only=False
     o2only=False
     
-    if parameterDictionary.__contains__('co2only'):
+    if 'co2only' in parameterDictionary:
         if parameterDictionary['co2only']:
             nms=DEFAULT_NMOL
             co2only=True
-    elif parameterDictionary.__contains__('o2only'):
-        if parameterDictionary['o2only']:
-            nms=DEFAULT_NMOL
-            o2only=True
+    elif parameterDictionary.get('o2only'):
+        nms=DEFAULT_NMOL
+        o2only=True
             
     # write record 1.3
     print("Writing Record 1.3")
     if monoRTM:
-        print('%10.3f%10.3f%10s%10.3e%63s%2i' % (waveNumber1,
-                                                       waveNumber2, '', deltaWaveNumber, '', nms), file=tape5file)
+        tape5Lines.append('%10.3f%10.3f%10s%10.3e%63s%2i' % (waveNumber1,
+                                                       waveNumber2, '', deltaWaveNumber, '', nms))
     else:
         if iodFlag:
-            print('%10.3f%10.3f%70s%10.3e  %2i' % (waveNumber1,
-                                                         waveNumber2, '', deltaWaveNumber, nms), file=tape5file)
+            tape5Lines.append('%10.3f%10.3f%70s%10.3e  %2i' % (waveNumber1,
+                                                         waveNumber2, '', deltaWaveNumber, nms))
         else:
-            print('%10.3f%10.3f%70s%10.3e  %2i' % (waveNumber1,
-                                                         waveNumber2, '', 0, nms), file=tape5file)
+            tape5Lines.append('%10.3f%10.3f%70s%10.3e  %2i' % (waveNumber1,
+                                                         waveNumber2, '', 0, nms))
         
     if nms>0:
-        print(' 1   1', file=tape5file)
+        tape5Lines.append(' 1   1')
         if o2only:
             stringFormat='%15d%15d%15d%15d%15d%15d%15d'
             scaleFactors=(0,0,0,0,0,0,1)
@@ -856,21 +905,20 @@ def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=
  
         # write record 1.3a
         print("Writing Record 1.3a")
-        print(stringFormat % scaleFactors, file=tape5file)
+        tape5Lines.append(stringFormat % scaleFactors)
         
     # write record 1.4
     print("Writing Record 1.4")
     if monoRTM:
-        print('%10.3f%10.3f%10.3f%10.3f%10.3f%10.3f%10.3f%5s' % tuple(surfaceTerrain + ['']), file=tape5file)
+        tape5Lines.append(_fmt_surface(surfaceTerrain, ''))
     else:
         if outputType == 1:
-            if parameterDictionary['angle'] > 90 and parameterDictionary['angle'] <= 180: surfRefl = ['l']
-            else: surfRefl = ['s']
-            print('%10.3f%10.3f%10.3f%10.3f%10.3f%10.3f%10.3f%5s' % tuple(surfaceTerrain + surfRefl), file=tape5file)
+            if parameterDictionary['angle'] > 90 and parameterDictionary['angle'] <= 180: surfRefl = 'l'
+            else: surfRefl = 's'
+            tape5Lines.append(_fmt_surface(surfaceTerrain, surfRefl))
 
         if outputType == 2 and parameterDictionary['iotFlag'] == 2:
-            surfRefl = ['s']
-            print('%10.3f%10.3f%10.3f%10.3f%10.3f%10.3f%10.3f%5s' % tuple(surfaceTerrain + surfRefl), file=tape5file)
+            tape5Lines.append(_fmt_surface(surfaceTerrain, 's'))
 
 
     if observer == target:
@@ -890,25 +938,31 @@ def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=
     hSpace = ''
     vBar = ''
 
-    if parameterDictionary.__contains__('refLatitude'): 
-        refLat = "%10.3f" % float(parameterDictionary['refLatitude'])
-    else: 
-        refLat = ''
+    refLat = parameterDictionary.get('refLatitude')
+    refLat = '' if refLat is None else "%10.3f" % float(refLat)
     
     if horz:
-        print('    %1d    1    0    1    0    7    1%2i %2i%10s%10s%10s%10s%10s' % \
-            (model, iFXTYPE, iMunits, Re, hSpace, vBar, '', refLat), file=tape5file)
-        print('    0.000                    %10.3f' % pl, file=tape5file)
+        tape5Lines.append('    %1d    1    0    1    0    7    1%2i %2i%10s%10s%10s%10s%10s' % \
+            (model, iFXTYPE, iMunits, Re, hSpace, vBar, '', refLat))
+        tape5Lines.append('    0.000                    %10.3f' % pl)
         userDefinedLayers = 0
     else:
         print(f"User defined layers are: {userDefinedLayers}")
-        print('    %1d    %1d%5d    1    0    7    1%2i %2i%10s%10s%10s%10s%10s' % (model, heightType, 
+        tape5Lines.append('    %1d    %1d%5d    1    0    7    1%2i %2i%10s%10s%10s%10s%10s' % (model, heightType, 
                                                                                                   userDefinedLayers, 
                                                                                                   iFXTYPE,
                                                                                                   iMunits, Re, 
                                                                                                   hSpace, vBar, '', 
-                                                                                                  refLat), file=tape5file)
-        print('%10.3f%10.3f%10.3f%10s%5i' % (observer, target, angle,'',tangent), file=tape5file)
+                                                                                                  refLat))
+        tape5Lines.append('%10.3f%10.3f%10.3f%10s%5i' % (observer, target, angle,'',tangent))
+
+    # write record 3.3B, user defined layer boundaries (both profile types)
+    if userDefinedLayers:
+        if userDefinedLayers > 0:
+            print("Writing user defined layers")
+            tape5Lines.extend(_fmt_grouped(userAltitudes))
+        else:
+            tape5Lines.extend(_fmt_grouped(userPressures))
 
     if not model:
         # aptg is altitude, pressure, temperature and gases vector
@@ -920,25 +974,10 @@ def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=
         for i in range(len(aptg), 9): aptg.append(6)
         if len(aptg) > 9: aptg = aptg[:9]
         
-        if parameterDictionary.__contains__('Height'): 
-            a = parameterDictionary['Height']
-        else: 
-            a = None
-
-        if parameterDictionary.__contains__('Pres'): 
-            p = parameterDictionary['Pres']
-        else: 
-            p = None
-            
-        if parameterDictionary.__contains__('Temp'): 
-            t = parameterDictionary['Temp']
-        else: 
-            t = None
-
-        if parameterDictionary.__contains__('WV'): 
-            w = parameterDictionary['WV']
-        else: 
-            w = None
+        a = parameterDictionary.get('Height')
+        p = parameterDictionary.get('Pres')
+        t = parameterDictionary.get('Temp')
+        w = parameterDictionary.get('WV')
 
         if aptg[3] > '9': co2 = parameterDictionary['CO2']
         else: co2 = None
@@ -958,128 +997,59 @@ def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=
         if aptg[8] > '9': o2 = parameterDictionary['O2']
         else: o2 = None
 
+        # sort levels by altitude (ascending) or pressure (descending)
+        # and apply the same permutation to every profile; the sort is
+        # stable so repeated levels keep their input order
         if units > 0:
-            b = sorted(a)
-            z = map(a.index, b)
+            z = np.argsort(np.asarray(a, dtype=float), kind='stable')
         else:
-            b = sorted(p, reverse=1)
-            z = map(p.index, b)
-
-        if a: a = map(lambda x: a[x] / 1000, z)
-        if p: p = map(lambda x: p[x], z)
-
-        if t is not None: t = map(lambda x: t[x], z)
-        if w is not None: w = map(lambda x: w[x], z)
-        if co2 is not None: co2 = map(lambda x: co2[x], z)
-        if o3 is not None: o3 = map(lambda x: o3[x], z)
-        if n2o is not None: n2o = map(lambda x: n2o[x], z)
-        if co is not None: co = map(lambda x: co[x], z)
-        if ch4 is not None: ch4 = map(lambda x: ch4[x], z)
-        if o2 is not None: o2 = map(lambda x: o2[x], z)
-
-        if userDefinedLayers:
-            if userDefinedLayers > 0:
-                print("Writing user defined layers")
-                for i in range(0, len(userAltitudes), 8):
-                    # print('', file=tape5file)
-                    x = userAltitudes[i: i+8]
-                    # for j in range(8):
-                    #     x.append(userAltitudes[i + j])
-                    try:
-                        print(''.join(['%10.3f']*len(x)) % tuple(x), file=tape5file)
-                    except IndexError:
-                        break
-                    # print >> tape5file
-            else:
-                for i in range(0, len(userPressures), 8):
-                    # print('', file=tape5file)
-                    x = userPressures[i: i+8]
-                    
-                    try:
-                        print(''.join(['%10.3f']*len(x)) % tuple(x), file=tape5file)
-                    except IndexError:
-                        break
-                    
-        else:
-            if not horz:
-                # print >> tape5file
-                pass
+            z = np.argsort(-np.asarray(p, dtype=float), kind='stable')
+
+        def reorder(variable):
+            if variable is None: return None
+            return np.asarray(variable, dtype=float)[z]
+
+        a = reorder(a) / 1000. if a is not None and len(a) > 0 else None
+        p = reorder(p)
+        t = reorder(t)
+        w = reorder(w)
+        co2 = reorder(co2)
+        o3 = reorder(o3)
+        n2o = reorder(n2o)
+        co = reorder(co)
+        ch4 = reorder(ch4)
+        o2 = reorder(o2)
 
         if horz:
-            print(\
+            tape5Lines.append(\
                 '    1                 Input from python application max h=%dm' \
-                % observer, file=tape5file)
+                % observer)
         else:
-            print(\
+            tape5Lines.append(\
                 '%5d               Input from python application max h=%dm' \
-                % (units * len(p), observer), file=tape5file)
-
-        fmt = '%10.3f%10.3f%10.3f     %s%s   %s%s%s%s%s%s%s'
-
-        fmt2 = ''
+                % (units * len(p), observer))
 
-        def addFormatString(variable):
-            if variable is not None: return '%10.3e'
-            return '          '
+        fmt = '%10.3f%10.3f%10.3f'
 
-        def addVariable(inputVector, variable, index):
-            if inputVector is None: inputVector = []
-            if variable is not None: inputVector.append(variable[index])
-            return inputVector
-
-        fmt2 += addFormatString(w)
-        fmt2 += addFormatString(co2)
-        fmt2 += addFormatString(o3)
-        fmt2 += addFormatString(n2o)
-        fmt2 += addFormatString(co)
-        fmt2 += addFormatString(ch4)
-        fmt2 += addFormatString(o2)
+        # species columns in TAPE5 order; absent species keep a blank field
+        profiles = (w, co2, o3, n2o, co, ch4, o2)
+        fmt2 = ''.join('%10.3e' if v is not None else ' ' * 10 for v in profiles)
+        species = [v for v in profiles if v is not None]
  
-        for i in range(len(p)):
-            if a: alt = a[i]
-            else: alt = 0
-
-            z = [alt, p[i], t[i]]
-
-            # write user defined first row
-            for j in aptg: z.append(j)
-            print(fmt % tuple(z), file=tape5file)
-
-            z = addVariable(None, w, i)
-            z = addVariable(z, co2, i)
-            z = addVariable(z, o3, i)
-            z = addVariable(z, n2o, i)
-            z = addVariable(z, co, i)
-            z = addVariable(z, ch4, i)
-            z = addVariable(z, o2, i)
-
-            # write user defined second row
-            print(fmt2 % tuple(z), file=tape5file)
-    else:
-        if userDefinedLayers:
-            if userDefinedLayers > 0:
-                for i in range(0, len(userAltitudes), 8):
-                    # print('', file=tape5file)
-                    x = userAltitudes[i: i+8]
-                    try:
-                        print(''.join(['%10.3f']*len(x)) % tuple(x), file=tape5file)
-                    except IndexError:
-                        break
-                    # print >> tape5file
-            else:
-                for i in range(0, len(userPressures), 8):
-                    # print('', file=tape5file)
-                    x = userPressures[i: i+8]
-                    
-                    try:
-                        print(''.join(['%10.3f']*len(x)) % tuple(x), file=tape5file)
-                    except IndexError:
-                        break
-                    # print >> tape5file
-        else:
-            if not horz:
-                # print >> tape5file
-                pass
+        # format every layer in one pass from a single (N, 3 + K) matrix of
+        # altitude, pressure, temperature and the K active species; the aptg
+        # suffix is constant, so it is rendered once for all first rows
+        suffix = '     %s%s   %s%s%s%s%s%s%s' % tuple(aptg)
+        alt = a if a is not None else np.zeros(len(p))
+        layers = np.column_stack([alt, p, t] + species).tolist()
+        rows = [fmt % tuple(row[:3]) + suffix for row in layers]
+        rows2 = [fmt2 % tuple(row[3:]) for row in layers]
+
+        # write user defined first and second rows, interleaved per layer
+        layerLines = [None] * (2 * len(p))
+        layerLines[0::2] = rows
+        layerLines[1::2] = rows2
+        tape5Lines.extend(layerLines)
 
     if aerosols and not monoRTM:
 
@@ -1095,37 +1065,43 @@ def writeTape5(path, parameterDictionary, isFile=False, monoRTM=False,useMeters=
 
         # aerosolString+="%10.3f%10.3f%10.3f%10.3f%10.3f"%(vis,0.0,0.0,0.0,gndAlt)
 
-        print(aerosolString, file=tape5file)
+        tape5Lines.append(aerosolString)
 
-    print('%', file=tape5file)
+    tape5Lines.append('%')
 
-    tape5file.close()
+    _writeLines(outputFileName, tape5Lines)
     return outputFileName
 
 def readARM(fileName):
-    nc = pupynere.netcdf_file(fileName)
-    h = (nc.variables['alt'])[:]
-    h = h - h[0]
-    p = (nc.variables['pres'])[:]
-    t = (nc.variables['tdry'])[:] + 273
-    td = (nc.variables['dp'])[:] + 273
-    rh = (nc.variables['rh'])[:]
-    uWinds = (nc.variables['u_wind'])[:]
-    vWinds = (nc.variables['v_wind'])[:]
-
-    tt = nc.variables['base_time']
-
-    nc.close()
-    return (
-        h,
-        p,
-        t,
-        td,
-        rh,
-        uWinds,
-        vWinds,
-        tt.data,
-        )
+  """
+  Read an ARM sounding (netCDF) in one pass
+
+  Input
+    fileName -- string, path to the ARM sonde netCDF file
+
+  Output
+    h, p, t, td, rh, u, v -- float arrays (height relative to the first 
+      level, temperatures in K) and the base_time array
+  """
+
+  # netCDF4 is only needed for ARM input, so import it here
+  import netCDF4 as nc
+
+  names = ('alt', 'pres', 'tdry', 'dp', 'rh', 'u_wind', 'v_wind')
+  with nc.Dataset(fileName, 'r') as ncObj:
+    # plain ndarrays rather than masked-array copies
+    ncObj.set_auto_mask(False)
+    h, p, t, td, rh, uWinds, vWinds = \
+      [ncObj.variables[name][:] for name in names]
+    tt = ncObj.variables['base_time'][...]
+  # endwith
+
+  h -= h[0]
+  t += 273
+  td += 273
+
+  return h, p, t, td, rh, uWinds, vWinds, tt
+# end readARM()
 
 class LblObject:
     outputList = {OPTICAL_DEPTH: 0, TRANSMISSION: 0, 'Radiance': 1, RADIANCE:1, TRANSMISSION:0, SOLAR:2}
@@ -1141,11 +1117,10 @@ class LblObject:
         'Arctic Winter': 5,
         'U.S. Standard': 6,
          }
+    modelValuesInv = {v: k for k, v in modelValues.items()}
 
     def getModelName(self, number):
-        for key in self.modelValues:
-            if self.modelValues[key] == int(number): return key
-        return None
+        return self.modelValuesInv.get(int(number))
     
     def getBaseRtParameters(self, dv=0.0001, others=dict()):
         data = {'dv': dv,
@@ -1189,6 +1164,10 @@ class LblObject:
 
     def makeWorkPath(self):
         if self.workPath:
+            # scratch files that run() creates and removes on every call
+            self.reflPath = os.path.join(self.workPath, self.reflFileName)
+            self.lblSolarPath = os.path.join(self.workPath, self.lblSolarFileName)
+
             try:
                 os.makedirs(self.workPath)
                 print("creating %s for lblrtm scratch files ..." % (self.workPath), file=self)
@@ -1244,7 +1223,10 @@ class LblObject:
         self.log = fileObject
         
     def genReflectance(self, wn, coeff):
-        return coeff[0] + coeff[1] * wn + coeff[2] * wn ** 2
+        if _refl_kernel is not None and isinstance(wn, np.ndarray):
+            return _refl_kernel(np.ascontiguousarray(wn, dtype=np.float64),
+                float(coeff[0]), float(coeff[1]), float(coeff[2]))
+        return coeff[0] + wn * (coeff[1] + wn * coeff[2])
 
     def writeReflectance(self, v1, v2, dv, reflCoeff):
     
@@ -1253,7 +1235,7 @@ class LblObject:
         nFillHeader = 264
         guardWN = 4
 
-        fortranFile = FortranFile.FortranFile(os.path.join(self.workPath, self.reflFileName), write=True)
+        fortranFile = FortranFile.FortranFile(self.reflPath, write=True)
 
         v1 = float(int(v1))
         v2 = float(int(v2))
@@ -1268,27 +1250,36 @@ class LblObject:
  
         # create formatted header
         
-        data = [map(lambda x:0, range(108)), [dv, startWN, endWN, 0, 0, 0], [1, 1], [0, 0, dv, 0, 0], [0, 1, 1, 0]]
+        data = [np.zeros(108).tolist(), [dv, startWN, endWN, 0, 0, 0], [1, 1], [0, 0, dv, 0, 0], [0, 1, 1, 0]]
         formatString = ['d', 'd', 'i', 'd', 'i', 'd']
         fortranFile.writeFormatVector(data, formatString, 1056)
 
         # write reflectances 
 
-        for startIndex in range(0, nWN, maxBlock):
-            startWN = startWN + startIndex * dv
-            endWN = startWN + (maxBlock - 1) * dv
-
-            if endWN > v2 + guardWN: endWN = v2 + guardWN
-            nBlock = int((endWN - startWN) / dv + 0.5) + 1
-            endWN = startWN + (nBlock - 1) * dv
+        # block plan: every block starts from the first wavenumber, so the
+        # block edges do not accumulate rounding (or offset) errors
+        blockIndex = np.arange(0, nWN, maxBlock)
+        starts = startWN + blockIndex * dv
+        lengths = np.minimum(maxBlock, nWN - blockIndex)
+        ends = starts + (lengths - 1) * dv
 
+        for startWN, endWN, nBlock in zip(starts.tolist(), ends.tolist(), lengths.tolist()):
             fortranFile.writeFormatVector((startWN, endWN, dv, nBlock), 'ddfi')
-            refl = map(lambda x:self.genReflectance(startWN + x * dv, reflCoeff), range(nBlock))
-            fortranFile.writeFloatVector(refl)
-           
+            wn = startWN + np.arange(nBlock) * dv
+            refl = self.genReflectance(wn, reflCoeff)
+            fortranFile.writeFloatVector(refl.tolist())
+        # end block loop
+
         fortranFile.writeFormatVector((endWN + dv, endWN, dv, -99), 'ddfi')
         fortranFile.close()
     
+    def runTape5(self, rtParameters, outputType, **kwargs):
+        # write the TAPE5 for one output type and run lblrtm on it; the
+        # runs share the work path scratch files, so they run one at a time
+        rtParameters['output'] = self.outputList[outputType]
+        tape5 = writeTape5(self.workPath, rtParameters)
+        return run(self.rtCommand, self.tape3fileName, tape5, **kwargs)
+
     def run(self, rtParameters,
             opticalDepthFlag=True, radianceFlag=False,
             upwellingFlag=False, downwellingFlag=False,
@@ -1300,41 +1291,38 @@ class LblObject:
         
         output = dict()
 
-        outputGrid = map(lambda x:x * rtParameters['dv'] + rtParameters['v1'],
-                       range(int((rtParameters['v2'] - rtParameters['v1']) / rtParameters['dv'] + 0.5)))
+        nGrid = int((rtParameters['v2'] - rtParameters['v1']) / rtParameters['dv'] + 0.5)
+        outputGrid = np.arange(nGrid, dtype=np.float64) * rtParameters['dv'] + rtParameters['v1']
         
-        if rtParameters.__contains__('opticalDepthFlag'): opticalDepthFlag = rtParameters['opticalDepthFlag']
-        if rtParameters.__contains__('radianceFlag'): radianceFlag = rtParameters['radianceFlag']
-        if rtParameters.__contains__('downwellingFlag'): downwellingFlag = rtParameters['downwellingFlag']
-        if rtParameters.__contains__('upwellingFlag'): upwellingFlag = rtParameters['upwellingFlag']
-        if rtParameters.__contains__('numberDensityFlag'): numberDensityFlag = rtParameters['numberDensityFlag']
-        if rtParameters.__contains__('tangentFlag'): tangentFlag = rtParameters['tangentFlag']
-        if rtParameters.__contains__('layerOpticalDepthFlag'): layerOpticalDepthFlag = rtParameters['layerOpticalDepthFlag']
+        opticalDepthFlag = rtParameters.get('opticalDepthFlag', opticalDepthFlag)
+        radianceFlag = rtParameters.get('radianceFlag', radianceFlag)
+        downwellingFlag = rtParameters.get('downwellingFlag', downwellingFlag)
+        upwellingFlag = rtParameters.get('upwellingFlag', upwellingFlag)
+        numberDensityFlag = rtParameters.get('numberDensityFlag', numberDensityFlag)
+        tangentFlag = rtParameters.get('tangentFlag', tangentFlag)
+        layerOpticalDepthFlag = rtParameters.get('layerOpticalDepthFlag', layerOpticalDepthFlag)
 
         if upwellingFlag or downwellingFlag:
             # setup solar file
-            try: os.remove(os.path.join(self.workPath, self.lblSolarFileName))
+            try: os.remove(self.lblSolarPath)
             except OSError: pass
 
-            try: os.symlink(self.solarFileName, os.path.join(self.workPath, self.lblSolarFileName))
-            except OSError: shutil.copy(self.solarFileName, os.path.join(self.workPath, self.lblSolarFileName))
+            try: os.symlink(self.solarFileName, self.lblSolarPath)
+            except OSError: shutil.copy(self.solarFileName, self.lblSolarPath)
 
         if opticalDepthFlag:
-            rtParameters['output'] = self.outputList[OPTICAL_DEPTH]
-            tape5 = writeTape5(self.workPath, rtParameters)
-
-            results = run(self.rtCommand, self.tape3fileName, tape5, ostream=self, 
-                          readNumberDensity=numberDensityFlag,
-                          readLayerOpticalDepths=layerOpticalDepthFlag,
-                          thread=thread)
+            results = self.runTape5(rtParameters, OPTICAL_DEPTH, ostream=self,
+                                    readNumberDensity=numberDensityFlag,
+                                    readLayerOpticalDepths=layerOpticalDepthFlag,
+                                    thread=thread)
 
-            if results.__contains__(OPTICAL_DEPTH):
-                if not (downwellingFlag or upwellingFlag): output[WAVE_NUMBER] = outputGrid[:]
-                output[OPTICAL_DEPTH] = np.interp(outputGrid, results[OPTICAL_DEPTH][0], results[OPTICAL_DEPTH][1]).tolist()
+            if OPTICAL_DEPTH in results:
+                if not (downwellingFlag or upwellingFlag): output[WAVE_NUMBER] = outputGrid
+                output[OPTICAL_DEPTH] = np.interp(outputGrid, results[OPTICAL_DEPTH][0], results[OPTICAL_DEPTH][1])
 
-                if results.__contains__(NUMBER_DENSITY):
+                if NUMBER_DENSITY in results:
                     output[NUMBER_DENSITY] = results[NUMBER_DENSITY][:]
-                if results.__contains__(LAYER_OPTICAL_DEPTHS):
+                if LAYER_OPTICAL_DEPTHS in results:
                     output[LAYER_OPTICAL_DEPTHS] = results[LAYER_OPTICAL_DEPTHS][:]
         
         if radianceFlag or downwellingFlag or upwellingFlag:
@@ -1342,9 +1330,9 @@ class LblObject:
             tape5 = writeTape5(self.workPath, rtParameters)
             results = run([os.path.join(self.workPath,self.rtCommand), self.tape3fileName, tape5], capture_output=True)
             
-            if results.__contains__(RADIANCE):
-                if radianceFlag: output[WAVE_NUMBER] = outputGrid[:]
-                output[RADIANCE] = (np.interp(outputGrid, results[RADIANCE][0], results[RADIANCE][1]) * 1e4).tolist()
+            if RADIANCE in results:
+                if radianceFlag: output[WAVE_NUMBER] = outputGrid
+                output[RADIANCE] = np.interp(outputGrid, results[RADIANCE][0], results[RADIANCE][1]) * 1e4
 
         if downwellingFlag or upwellingFlag:
             # lblrtm run number 1
@@ -1354,41 +1342,32 @@ class LblObject:
             # H1 is the surface, H2 is TOA and the angle is the solar zenith angle.
             # Note that downward radiance from this calculation is not used.
 
-            localRtParameters = rtParameters.copy()
+            # overrides sit in front of rtParameters; writes stay local
+            localRtParameters = ChainMap({
+                'h2': 0 if tangentFlag else 100000,
+                'angle': rtParameters['solarZenithAngle'],
+                'surfaceTerrain': [0, 0, 0, 0, 0, 0, 0]}, rtParameters)
+            if not tangentFlag:
+                localRtParameters['h1'] = min(rtParameters['h1'], rtParameters['h2'])
 
-            if tangentFlag:
-                localRtParameters['h2'] = 0
-            else:
-                localRtParameters['h2'] = 100000
-                localRtParameters['h1'] = min([rtParameters['h1'], rtParameters['h2']])
-                
-            localRtParameters['angle'] = rtParameters['solarZenithAngle']
-            localRtParameters['surfaceTerrain'] = [0, 0, 0, 0, 0, 0, 0]
-             
-            localRtParameters['output'] = self.outputList[OPTICAL_DEPTH]
-            tape5 = writeTape5(self.workPath, localRtParameters)
-            results = run(self.rtCommand, self.tape3fileName, tape5, thread=thread)
-            if results.__contains__(OPTICAL_DEPTH):
+            results = self.runTape5(localRtParameters, OPTICAL_DEPTH, thread=thread)
+            if OPTICAL_DEPTH in results:
                 output[SOLAR_OPTICAL_DEPTH] = np.interp(outputGrid, results[OPTICAL_DEPTH][0],
-                                                      results[OPTICAL_DEPTH][1]).tolist()
+                                                      results[OPTICAL_DEPTH][1])
 
-            localRtParameters['output'] = self.outputList[RADIANCE]
-            tape5 = writeTape5(self.workPath, localRtParameters)
-            wn, radiance = run(self.rtCommand, self.tape3fileName, tape5, ostream=self, thread=thread)
+            wn, radiance = self.runTape5(localRtParameters, RADIANCE, ostream=self, thread=thread)
             if self.debug: self.copyTapeFile('TAPE5', 'TAPE5.downwelling')
 
             # run lblrtm a second time (could be combined with first run lbl call)
             
-            localRtParameters['output'] = self.outputList[SOLAR]
             localRtParameters['inFlag'] = 0
             localRtParameters['iotFlag'] = 1
-            tape5 = writeTape5(self.workPath, localRtParameters)
-            results = run(self.rtCommand, self.tape3fileName, tape5, ostream=self, clean=False, readSolar=True,
-                        thread=thread)
+            results = self.runTape5(localRtParameters, SOLAR, ostream=self, clean=False, readSolar=True,
+                                    thread=thread)
             
-            if results.__contains__(SOLAR):
+            if SOLAR in results:
                 if not upwellingFlag: 
-                    output[WAVE_NUMBER] = outputGrid[:]
+                    output[WAVE_NUMBER] = outputGrid
                 # convert from 1/cm2 to 1/m2
                 # output[RADIANCE]=(np.interp(outputGrid,wn,radiance)*1e4).tolist()
                 
@@ -1408,15 +1387,10 @@ class LblObject:
 
                 output[SOLAR_RADIANCE] = (np.interp(outputGrid, results[SOLAR][0], results[SOLAR][1]) * 1e4)
                 output[SOLAR_RADIANCE] *= 6.8e-5
-                output[SOLAR_RADIANCE] = output[SOLAR_RADIANCE].tolist()
                 
         if upwellingFlag:
-            localRtParameters = rtParameters.copy()
-
-            if rtParameters.__contains__('surfaceTerrain'):   
-                surfaceParameters = rtParameters['surfaceTerrain']
-            else: 
-                surfaceParameters = [300, 0.8, 0, 0, 0.2 / math.pi, 0, 0]
+            surfaceParameters = rtParameters.get('surfaceTerrain',
+                [300, 0.8, 0, 0, 0.2 / math.pi, 0, 0])
 
             # write solar reflectance file
                 
@@ -1424,14 +1398,17 @@ class LblObject:
 
             # temporary method
                         
-            reflectance = self.genReflectance(np.asarray(outputGrid), surfaceParameters[4:])
+            reflectance = self.genReflectance(outputGrid, surfaceParameters[4:])
 
             try:
-                output[SOLAR_RADIANCE] = np.asarray(output[SOLAR_RADIANCE]) * np.exp(-np.asarray(output[OPTICAL_DEPTH]))
-                output[SOLAR_RADIANCE] *= reflectance
-                output[SOLAR_RADIANCE] += np.asarray(output[RADIANCE])
-                output[SOLAR_RADIANCE] = output[SOLAR_RADIANCE].tolist()
-                output[WAVE_NUMBER] = outputGrid[:]
+                # solar * exp(-od) * reflectance + radiance in one buffer
+                upwelling = np.negative(output[OPTICAL_DEPTH])
+                np.exp(upwelling, out=upwelling)
+                upwelling *= output[SOLAR_RADIANCE]
+                upwelling *= reflectance
+                upwelling += output[RADIANCE]
+                output[SOLAR_RADIANCE] = upwelling
+                output[WAVE_NUMBER] = outputGrid
             except (KeyboardInterrupt, SystemExit):
                 raise
             except:
@@ -1489,11 +1466,15 @@ class LblObject:
             '''
 
         if not self.debug:
-            try: os.remove(os.path.join(self.workPath, self.reflFileName))
+            try: os.remove(self.reflPath)
             except OSError: pass
-            try: os.remove(os.path.join(self.workPath, self.lblSolarFileName))
+            try: os.remove(self.lblSolarPath)
             except OSError: pass
 
+        # spectra are kept as ndarrays above and handed back as lists
+        for key in (WAVE_NUMBER, OPTICAL_DEPTH, RADIANCE, SOLAR_OPTICAL_DEPTH, SOLAR_RADIANCE):
+            if key in output: output[key] = output[key].tolist()
+
         return output
 
     def copyTapeFile(self, inputFile, outputFile):
@@ -1536,7 +1517,7 @@ class MonoRtmObject(LblObject):
         results = run(self.rtCommand, self.tape3fileName, tape5, \
           ostream=self, thread=thread, monoRTM=True, cwd=self.workPath)
 
-        if results.__contains__(RADIANCE):
+        if RADIANCE in results:
             output = dict()
             output[WAVE_NUMBER] = results[RADIANCE][0]
             output[RADIANCE] = results[RADIANCE][1]